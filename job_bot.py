@@ -1,17 +1,43 @@
+import asyncio
+import hashlib
 import json
 import os
 import re
-import requests
-from bs4 import BeautifulSoup
+import time
+from urllib.parse import urlparse
+
+import httpx
+from lxml import etree
+from lxml import html as lh
+
+try:
+    import redis
+except ImportError:  # Redis is optional; without it seen IDs are kept in SEEN_FILE
+    redis = None
 
 # ========= SETTINGS =========
 
 # Read Telegram config from environment variables
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")  # e.g. "123456789"
+TELEGRAM_MAX_LEN = 4096  # Telegram rejects longer messages
 
 SEEN_FILE = "seen_jobs.json"
 
+# ETag / Last-Modified of the search and list pages, so unchanged pages come back as 304
+HTTP_CACHE_FILE = "http_cache.json"
+
+# When REDIS_URL is set, seen IDs are kept in Redis instead of SEEN_FILE and expire after SEEN_TTL
+REDIS_URL = os.environ.get("REDIS_URL")
+SEEN_TTL = 60 * 60 * 24 * 60  # 60 days, in seconds
+SEEN_KEYS = {"nhs": "seen:nhs", "healthjobsuk": "seen:hj"}
+
+# Job IDs whose detail page failed to fetch are not retried until MISS_TTL has passed
+# (kept in Redis as MISS_KEYS-prefixed keys, otherwise in MISS_FILE)
+MISS_FILE = "detail_misses.json"
+MISS_TTL = 60 * 60  # 1 hour, in seconds
+MISS_KEYS = {"nhs": "miss:nhs", "healthjobsuk": "miss:hj"}
+
 # Keywords for junior doctor level roles (across specialties)
 KEYWORDS = [
     "junior clinical fellow",
@@ -35,6 +61,9 @@ KEYWORDS = [
     "trust grade",
 ]
 
+# All keywords as one alternation so each title is scanned once (plain substring match, like `k in text`)
+KEYWORD_RE = re.compile("|".join(re.escape(k) for k in KEYWORDS))
+
 NHS_SEARCH_URLS = [
     "https://www.jobs.nhs.uk/candidate/search/results?keyword=Junior+clinical+fellow&language=en",
     "https://www.jobs.nhs.uk/candidate/search/results?keyword=junior+doctor&language=en",
@@ -42,273 +71,716 @@ NHS_SEARCH_URLS = [
 
 HEALTHJOBSUK_LIST_URL = "https://www.healthjobsuk.com/job_list/s2"
 
+# Listing pages per source, as keyed in seen/misses
+LISTING_URLS = {"nhs": NHS_SEARCH_URLS, "healthjobsuk": [HEALTHJOBSUK_LIST_URL]}
+
+# How job links are recognised on the search/list pages, and where their IDs sit in the URL
+NHS_SITE = "https://www.jobs.nhs.uk"
+NHS_JOB_PATH = "/candidate/jobadvert/"
+NHS_ID_RE = re.compile(r"/candidate/jobadvert/([^/?]+)")
+
+HEALTHJOBSUK_SITE = "https://www.healthjobsuk.com"
+HEALTHJOBSUK_JOB_PREFIX = "/job/UK/"
+HJ_ID_RE = re.compile(r"-v(\d+)")
+
+# Skip the detail page when the search result card already shows every field.
+# Set to True to always fetch detail pages, e.g. to compare both sources of details.
+FORCE_DETAIL_FETCH = False
+CARD_FIELDS = ("employer", "specialty", "salary", "location")
+
+# Job detail pages are fetched concurrently, but spaced out so we don't hammer either site
+DETAIL_CONCURRENCY = 8
+MIN_REQUEST_INTERVAL = 0.2  # seconds between detail requests to the same host
+
+REDIS = None
+if REDIS_URL:
+    if redis:
+        REDIS = redis.Redis.from_url(REDIS_URL)
+    else:
+        print("REDIS_URL is set but the redis package is not installed; falling back to", SEEN_FILE)
+
 
 # ========= UTILS =========
+def make_client():
+    # One HTTP/2 client for the whole run: requests to the same host share a connection.
+    # httpx negotiates gzip/deflate (and br when brotli is installed) on its own.
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=16, max_connections=16),
+        retries=2,  # connection failures only
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=20,
+        follow_redirects=True,
+        headers={"User-Agent": "job-bot/1.0"},
+    )
+
+
+class DomainRateLimiter:
+    # Spaces requests to the same host at least min_gap seconds apart; different hosts don't wait on each other
+    def __init__(self, min_gap):
+        self.min_gap = min_gap
+        self.next_at = {}
+
+    async def wait(self, host):
+        # Reserve the host's next free slot before awaiting; the event loop makes this race-free
+        now = time.monotonic()
+        start = max(now, self.next_at.get(host, 0.0))
+        self.next_at[host] = start + self.min_gap
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+RATE_LIMITER = DomainRateLimiter(MIN_REQUEST_INTERVAL)
+
+
+async def throttled_get(client, url):
+    await RATE_LIMITER.wait(urlparse(url).netloc)
+    return await client.get(url)
+
+
+def write_json(path, data):
+    # Leave the file alone if its content wouldn't change; otherwise replace it atomically,
+    # so a crash mid-write can never leave a truncated file behind
+    payload = json.dumps(data, sort_keys=True).encode("utf-8")
+    digest = hashlib.blake2b(payload).digest()
+    try:
+        with open(path, "rb") as f:
+            if hashlib.blake2b(f.read()).digest() == digest:
+                return
+    except OSError:
+        pass
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def known_ids(ids, job_ids):
+    # The job_ids already in ids; Redis-backed stores answer for a whole page in one round trip
+    if hasattr(ids, "known"):
+        return ids.known(job_ids)
+    return {job_id for job_id in job_ids if job_id in ids}
+
+
+def touch_ids(ids, job_ids):
+    # Mark job_ids as still listed, so a store that expires old IDs keeps them
+    if hasattr(ids, "touch"):
+        ids.touch(job_ids)
+
+
+class RedisSeenSet:
+    # View over a Redis sorted set of job IDs scored by when they were last seen listed.
+    # Scores let IDs expire one by one once their ad leaves the listings; adds and score refreshes
+    # are buffered and written in one pipeline on flush().
+    def __init__(self, client, key):
+        self.client = client
+        self.key = key
+        self.pending = set()
+        self.listed = set()
+
+    def known(self, job_ids):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return set()
+        scores = self.client.zmscore(self.key, job_ids)
+        found = {job_id for job_id, score in zip(job_ids, scores) if score is not None}
+        self.listed |= found
+        return found | (self.pending & set(job_ids))
+
+    def touch(self, job_ids):
+        self.listed.update(job_ids)
+
+    def add(self, job_id):
+        self.pending.add(job_id)
+
+    def seed(self, job_ids):
+        # Carry IDs over from SEEN_FILE the first time Redis is used, so they aren't alerted again
+        if job_ids and not self.client.exists(self.key):
+            self.client.zadd(self.key, {job_id: time.time() for job_id in job_ids}, nx=True)
+
+    def flush(self):
+        now = time.time()
+        with self.client.pipeline() as p:
+            if self.pending:
+                p.zadd(self.key, {job_id: now for job_id in self.pending}, nx=True)
+            # xx: only refresh IDs already stored, never add ones that weren't alerted
+            refresh = self.listed - self.pending
+            if refresh:
+                p.zadd(self.key, {job_id: now for job_id in refresh}, xx=True)
+            p.zremrangebyscore(self.key, "-inf", now - SEEN_TTL)
+            p.execute()
+        self.pending.clear()
+        self.listed.clear()
+
+
 def load_seen():
+    file_seen = load_seen_file()
+    if REDIS:
+        seen = {source: RedisSeenSet(REDIS, key) for source, key in SEEN_KEYS.items()}
+        for source, ids in seen.items():
+            ids.seed(file_seen[source])
+        return seen
+    return file_seen
+
+
+def load_seen_file():
     if os.path.exists(SEEN_FILE):
         try:
             with open(SEEN_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+                data = json.load(f)
+            # Sets give O(1) membership checks against the growing history
+            return {"nhs": set(data.get("nhs", [])), "healthjobsuk": set(data.get("healthjobsuk", []))}
         except Exception:
             pass
-    return {"nhs": [], "healthjobsuk": []}
+    return {"nhs": set(), "healthjobsuk": set()}
 
 
 def save_seen(seen):
-    with open(SEEN_FILE, "w", encoding="utf-8") as f:
-        json.dump(seen, f)
+    if REDIS:
+        for ids in seen.values():
+            ids.flush()
+        return
+
+    # Sorted so the file stays stable between runs
+    write_json(SEEN_FILE, {k: sorted(v) for k, v in seen.items()})
+
+
+class RedisMissSet:
+    # View over one Redis key per failed job ID, "<prefix>:<job_id>", each expiring after MISS_TTL
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+        self.pending = set()
+
+    def known(self, job_ids):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return set()
+        values = self.client.mget([f"{self.prefix}:{job_id}" for job_id in job_ids])
+        found = {job_id for job_id, value in zip(job_ids, values) if value is not None}
+        return found | (self.pending & set(job_ids))
+
+    def add(self, job_id):
+        self.pending.add(job_id)
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.client.pipeline() as p:
+            for job_id in self.pending:
+                p.setex(f"{self.prefix}:{job_id}", MISS_TTL, "1")
+            p.execute()
+        self.pending.clear()
+
 
+class FileMissSet:
+    # Same interface as RedisMissSet, backed by {job_id: expires_at} from MISS_FILE
+    def __init__(self, expiries):
+        now = time.time()
+        self.expiries = {job_id: t for job_id, t in expiries.items() if t > now}
 
-def send_telegram(text):
+    def __contains__(self, job_id):
+        return job_id in self.expiries
+
+    def add(self, job_id):
+        self.expiries[job_id] = time.time() + MISS_TTL
+
+
+def load_misses():
+    if REDIS:
+        return {source: RedisMissSet(REDIS, prefix) for source, prefix in MISS_KEYS.items()}
+
+    if os.path.exists(MISS_FILE):
+        try:
+            with open(MISS_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {source: FileMissSet(data.get(source, {})) for source in MISS_KEYS}
+        except Exception:
+            pass
+    return {source: FileMissSet({}) for source in MISS_KEYS}
+
+
+def save_misses(misses):
+    if REDIS:
+        for ids in misses.values():
+            ids.flush()
+        return
+
+    write_json(MISS_FILE, {k: v.expiries for k, v in misses.items()})
+
+
+def load_http_cache():
+    if os.path.exists(HTTP_CACHE_FILE):
+        try:
+            with open(HTTP_CACHE_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # Only well-formed {url: {...}} entries; anything else just means a full GET
+            return {url: entry for url, entry in data.items() if isinstance(entry, dict)}
+        except Exception:
+            pass
+    return {}
+
+
+def save_http_cache(http_cache):
+    write_json(HTTP_CACHE_FILE, http_cache)
+
+
+async def conditional_get(client, url, http_cache):
+    # Returns None when the server says the page hasn't changed since the validators were cached.
+    # The new validators are only cached by remember_pages, once the page's jobs have all been handled.
+    cached = http_cache.get(url, {})
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    r = await client.get(url, headers=headers)
+    if r.status_code == 304:
+        return None
+    r.raise_for_status()
+    return r
+
+
+def remember_pages(http_cache, pages, failed):
+    # pages: (url, response, job IDs on the page, IDs on it still waiting out a miss).
+    # A page that still holds a failed or missed job must be re-read in full when that job is due
+    # for a retry, so only pages whose jobs were all handled keep validators for a 304 next run.
+    # The page's job IDs are kept too, so a 304 can still mark them as listed (and forget_pages
+    # can find the pages holding a job).
+    for url, r, page_ids, missed in pages:
+        if missed or page_ids & failed:
+            http_cache.pop(url, None)
+        else:
+            http_cache[url] = {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "ids": sorted(page_ids),
+            }
+
+
+def forget_pages(http_cache, source, job_ids):
+    # Drop the validators of the source's listing pages that hold any of job_ids,
+    # so those pages are re-read in full (not answered with 304) next run
+    for url in LISTING_URLS[source]:
+        if set(http_cache.get(url, {}).get("ids", [])) & job_ids:
+            del http_cache[url]
+
+
+async def send_telegram(client, text):
+    # Returns False only when the send failed in a way worth retrying next run
+    # (network error, 429 or 5xx); permanent errors such as a bad token or chat ID are logged
+    # and treated as done, since resending the same alert would fail the same way.
     # Safety check: make sure env vars are set
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         print("Telegram token or chat ID not set. Set TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID in environment.")
-        return
+        return True
 
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     data = {"chat_id": TELEGRAM_CHAT_ID, "text": text}
     try:
-        resp = requests.post(url, json=data)
-        if not resp.ok:
-            print("Telegram error:", resp.text)
+        resp = await client.post(url, json=data)
     except Exception as e:
         print("Telegram send failed:", e)
+        return False
+    if not resp.is_success:
+        print("Telegram error:", resp.status_code, resp.text)
+        return not (resp.status_code == 429 or resp.status_code >= 500)
+    return True
 
 
-def format_message(job_url, data):
-    lines = [
-        f"New Job Found @ {data['source']}",
-        "",
-        f"Job Link ({job_url})",
-        "",
-        f"Title: {data['title']}",
-        f"Employer: {data['employer']}",
-        f"Specialty: {data['specialty']}",
-        f"Salary: {data['salary']}",
-        f"Location: {data['location']}",
+def page_links(r):
+    # [(href, <a> element)] for every link on a search/list page, read straight off the lxml tree;
+    # None if the page couldn't be parsed
+    try:
+        tree = html_tree(r)
+    except (etree.ParserError, LookupError) as e:
+        print("Failed to parse listing page:", e)
+        return None
+    return [
+        (link, element)
+        for element, attribute, link, _ in tree.iterlinks()
+        if attribute == "href" and element.tag == "a"
     ]
-    return "\n".join(lines)
+
+
+def link_text(element):
+    # Same text as BeautifulSoup's get_text(" ", strip=True): stripped pieces joined by spaces.
+    # Most links hold plain text only, which needs no walk over child nodes.
+    if len(element) == 0:
+        return (element.text or "").strip()
+    return " ".join(t.strip() for t in element.itertext() if t.strip())
+
+
+def card_details(a, source, extract_fields):
+    # Details read off the result card (<li>) around a job link, or None if the card is missing a field
+    if FORCE_DETAIL_FETCH:
+        return None
+    card = next(a.iterancestors("li"), None)
+    if card is None:
+        return None
+    fields = extract_fields(card)
+    if any(field not in fields for field in CARD_FIELDS):
+        return None
+    return {"source": source, "title": clean_text(a), **fields}
+
+
+def add_candidates(candidates, links, seen_ids, miss_ids, source, extract_fields):
+    # Queue the page's matching links whose job IDs are neither seen nor recently missed, and
+    # return the recently missed ones. links maps job_id -> (url, <a> element); the whole page
+    # is checked against each store at once.
+    missed = known_ids(miss_ids, links)
+    known = known_ids(seen_ids, links) | missed
+    for job_id, (full_url, a) in links.items():
+        if job_id not in known and job_id not in candidates:
+            candidates[job_id] = (full_url, card_details(a, source, extract_fields))
+    return missed
+
+
+def batch_messages(entries, sep="\n\n"):
+    # Pack (message, job) entries into as few Telegram-sized texts as possible,
+    # yielding each text with the jobs it carries
+    buf = []
+    jobs = []
+    size = 0
+    for msg, job in entries:
+        msg = msg[:TELEGRAM_MAX_LEN]  # an oversized alert would be rejected on every retry
+        if buf and size + len(sep) + len(msg) > TELEGRAM_MAX_LEN:
+            yield sep.join(buf), jobs
+            buf = []
+            jobs = []
+            size = 0
+        size += len(msg) + (len(sep) if buf else 0)
+        buf.append(msg)
+        jobs.append(job)
+    if buf:
+        yield sep.join(buf), jobs
+
+
+def clean_text(element):
+    # Element text with runs of whitespace (newlines, indentation) collapsed to single spaces
+    return " ".join(element.text_content().split())
+
+
+def html_tree(r):
+    # Only trust a charset the server actually sent (never r.text, which runs charset detection);
+    # otherwise libxml2 sniffs <meta charset>
+    try:
+        parser = lh.HTMLParser(encoding=r.charset_encoding)
+    except LookupError:
+        # Charset libxml2 doesn't know (e.g. "utf8mb4"); sniff the bytes as if none was declared
+        parser = lh.HTMLParser()
+    return lh.fromstring(r.content, parser=parser)
+
+
+async def collect_new_jobs(client, candidates, parse_details, miss_ids):
+    # Fetch detail pages concurrently; gather returns results in candidate order.
+    # Returns the new (job_id, url, details) jobs and the IDs whose details couldn't be fetched;
+    # main marks jobs as seen once their alert has been sent.
+    slots = asyncio.Semaphore(DETAIL_CONCURRENCY)
+
+    async def fetch(url, card):
+        if card:
+            return card
+        async with slots:
+            return await parse_details(client, url)
+
+    results = await asyncio.gather(*(fetch(url, card) for url, card in candidates.values()), return_exceptions=True)
+
+    new_jobs = []
+    failed = set()
+    for (job_id, (full_url, _)), details in zip(candidates.items(), results):
+        if isinstance(details, Exception):
+            print("Failed to parse job detail:", full_url, details)
+            details = None
+        if not details:
+            miss_ids.add(job_id)
+            failed.add(job_id)
+            continue
+        new_jobs.append((job_id, full_url, details))
+    return new_jobs, failed
+
+
+MESSAGE_TEMPLATE = (
+    "New Job Found @ %s\n"
+    "\n"
+    "Job Link (%s)\n"
+    "\n"
+    "Title: %s\n"
+    "Employer: %s\n"
+    "Specialty: %s\n"
+    "Salary: %s\n"
+    "Location: %s"
+)
+
+
+def format_message(job_url, data):
+    return MESSAGE_TEMPLATE % (
+        data["source"],
+        job_url,
+        data["title"],
+        data["employer"],
+        data["specialty"],
+        data["salary"],
+        data["location"],
+    )
 
 
 # ========= NHS JOBS =========
-def parse_nhs_job_details(url):
+# Heading label -> (field, heading tags it can appear in, tags that end its section)
+NHS_HEADINGS = {
+    "Employer name": ("employer", ("h2", "h3"), ("h2", "h3")),
+    "Salary": ("salary", ("h3", "h4"), ("h2", "h3", "h4")),
+    "Main area": ("specialty", ("h3", "h4"), ("h2", "h3", "h4")),
+    "Job locations": ("location", ("h2", "h3"), ("h2", "h3")),
+}
+
+
+def section_texts(heading, stop_tags, limit):
+    # Non-empty texts of the siblings after a heading, up to the next heading
+    parts = []
+    for sib in heading.itersiblings(tag=etree.Element):
+        if sib.tag in stop_tags:
+            break
+        txt = clean_text(sib)
+        if txt:
+            parts.append(txt)
+        if len(parts) >= limit:
+            break
+    return parts
+
+
+def nhs_fields(root):
+    # Fields found under the NHS_HEADINGS labels within root (a whole page or one result card).
+    # libxml2 finds each heading; the first match in document order wins.
+    fields = {}
+    for label, (field, heading_tags, stop_tags) in NHS_HEADINGS.items():
+        path = "(%s)[contains(., $label)][1]" % " | ".join(".//" + t for t in heading_tags)
+        heading = root.xpath(path, label=label)
+        if not heading:
+            continue
+        parts = section_texts(heading[0], stop_tags, 4 if field == "location" else 1)
+        if not parts:
+            continue
+        if field == "location" and len(parts) >= 2:
+            fields[field] = f"{parts[-2]}, {parts[-1]}"
+        else:
+            fields[field] = parts[0]
+    return fields
+
+
+async def parse_nhs_job_details(client, url):
     try:
-        r = requests.get(url, timeout=20)
+        r = await throttled_get(client, url)
         r.raise_for_status()
+        tree = html_tree(r)
     except Exception as e:
         print("Failed to fetch NHS job detail:", e)
         return None
 
-    soup = BeautifulSoup(r.text, "html.parser")
-    h1 = soup.find("h1")
-    title = h1.get_text(strip=True) if h1 else "No title"
-
-    employer = "Not specified"
-    emp_heading = soup.find(lambda tag: tag.name in ["h2", "h3"] and "Employer name" in tag.get_text())
-    if emp_heading:
-        for sib in emp_heading.find_next_siblings():
-            if sib.name in ["h2", "h3"]:
-                break
-            txt = sib.get_text(strip=True)
-            if txt:
-                employer = txt
-                break
-
-    salary = "Not specified"
-    sal_heading = soup.find(lambda tag: tag.name in ["h3", "h4"] and "Salary" in tag.get_text())
-    if sal_heading:
-        for sib in sal_heading.find_next_siblings():
-            if sib.name in ["h2", "h3", "h4"]:
-                break
-            txt = sib.get_text(strip=True)
-            if txt:
-                salary = txt
-                break
-
-    specialty = "Not specified"
-    main_area_heading = soup.find(lambda tag: tag.name in ["h3", "h4"] and "Main area" in tag.get_text())
-    if main_area_heading:
-        for sib in main_area_heading.find_next_siblings():
-            if sib.name in ["h2", "h3", "h4"]:
-                break
-            txt = sib.get_text(strip=True)
-            if txt:
-                specialty = txt
-                break
-
-    location = "Not specified"
-    loc_heading = soup.find(lambda tag: tag.name in ["h2", "h3"] and "Job locations" in tag.get_text())
-    if loc_heading:
-        parts = []
-        for sib in loc_heading.find_next_siblings():
-            if sib.name in ["h2", "h3"]:
-                break
-            txt = sib.get_text(strip=True)
-            if txt:
-                parts.append(txt)
-            if len(parts) >= 4:
-                break
-        if len(parts) >= 2:
-            location = f"{parts[-2]}, {parts[-1]}"
-        elif parts:
-            location = parts[0]
+    h1 = tree.find(".//h1")
+    title = clean_text(h1) if h1 is not None else "No title"
+
+    fields = nhs_fields(tree)
 
     return {
         "source": "NHS",
         "title": title,
-        "employer": employer,
-        "specialty": specialty,
-        "salary": salary,
-        "location": location,
+        "employer": fields.get("employer", "Not specified"),
+        "specialty": fields.get("specialty", "Not specified"),
+        "salary": fields.get("salary", "Not specified"),
+        "location": fields.get("location", "Not specified"),
     }
 
 
-def fetch_nhs_new_jobs(seen):
-    base_site = "https://www.jobs.nhs.uk"
-    new_jobs = []
+async def fetch_nhs_new_jobs(client, seen, misses, http_cache):
+    candidates = {}  # job_id -> (url, card details); the same job is often linked several times per page
+    pages = []
 
     for search_url in NHS_SEARCH_URLS:
         try:
-            r = requests.get(search_url, timeout=20)
-            r.raise_for_status()
+            r = await conditional_get(client, search_url, http_cache)
         except Exception as e:
             print("Failed to fetch NHS search:", e)
             continue
+        if r is None:
+            print("NHS search unchanged since last run:", search_url)
+            touch_ids(seen["nhs"], http_cache[search_url].get("ids", []))
+            continue
 
-        soup = BeautifulSoup(r.text, "html.parser")
+        page = page_links(r)
+        if page is None:
+            continue
 
-        for a in soup.find_all("a", href=True):
-            href = a["href"]
-            if "/candidate/jobadvert/" not in href:
+        links = {}  # job_id -> (url, <a>) for this page's links that match KEYWORDS
+        for href, a in page:
+            if NHS_JOB_PATH not in href:
                 continue
 
-            full_url = href if href.startswith("http") else base_site + href
-            m = re.search(r"/candidate/jobadvert/([^/?]+)", href)
+            full_url = href if href.startswith("http") else NHS_SITE + href
+            m = NHS_ID_RE.search(href)
             if not m:
                 continue
             job_id = m.group(1)
 
-            if job_id in seen["nhs"]:
+            title_text = link_text(a).lower()
+            if not KEYWORD_RE.search(title_text):
                 continue
 
-            title_text = a.get_text(" ", strip=True).lower()
-            if not any(k in title_text for k in KEYWORDS):
-                continue
-
-            details = parse_nhs_job_details(full_url)
-            if not details:
-                continue
+            links.setdefault(job_id, (full_url, a))
 
-            seen["nhs"].append(job_id)
-            new_jobs.append((full_url, details))
+        missed = add_candidates(candidates, links, seen["nhs"], misses["nhs"], "NHS", nhs_fields)
+        pages.append((search_url, r, set(links), missed))
 
+    new_jobs, failed = await collect_new_jobs(client, candidates, parse_nhs_job_details, misses["nhs"])
+    remember_pages(http_cache, pages, failed)
     return new_jobs
 
 
 # ========= HEALTHJOBSUK =========
-def parse_trac_label(soup, label_text):
-    label_node = soup.find(string=lambda t: isinstance(t, str) and t.strip() == label_text)
-    if not label_node:
-        return None
-    parent = label_node.parent
-    for sib in parent.find_next_siblings():
-        txt = sib.get_text(strip=True)
-        if txt:
-            return txt
-    return None
-
-
-def parse_healthjobsuk_job_details(url):
+# Trac label -> field
+HEALTHJOBSUK_LABELS = {
+    "Main area": "specialty",
+    "Employer": "employer",
+    "Salary": "salary",
+    "Town": "location",
+}
+
+
+def parse_trac_label(root, label_text):
+    # Value is the first non-empty sibling after the element holding the label text
+    value = root.xpath(
+        "(.//*[text()[normalize-space(.) = $label]])[1]/following-sibling::*[normalize-space(.) != ''][1]",
+        label=label_text,
+    )
+    return clean_text(value[0]) if value else None
+
+
+def healthjobsuk_fields(root):
+    # Fields found under the HEALTHJOBSUK_LABELS labels within root (a whole page or one result card)
+    fields = {}
+    for label, field in HEALTHJOBSUK_LABELS.items():
+        value = parse_trac_label(root, label)
+        if value:
+            fields[field] = value
+    return fields
+
+
+async def parse_healthjobsuk_job_details(client, url):
     try:
-        r = requests.get(url, timeout=20)
+        r = await throttled_get(client, url)
         r.raise_for_status()
+        tree = html_tree(r)
     except Exception as e:
         print("Failed to fetch HealthJobsUK job detail:", e)
         return None
 
-    soup = BeautifulSoup(r.text, "html.parser")
-    title_tag = soup.find("h1") or soup.find("h2")
-    title = title_tag.get_text(strip=True) if title_tag else "No title"
+    title_tag = tree.find(".//h1")
+    if title_tag is None:
+        title_tag = tree.find(".//h2")
+    title = clean_text(title_tag) if title_tag is not None else "No title"
 
-    specialty = parse_trac_label(soup, "Main area") or "Not specified"
-    employer = parse_trac_label(soup, "Employer") or "Not specified"
-    salary = parse_trac_label(soup, "Salary") or "Not specified"
-    town = parse_trac_label(soup, "Town")
-    location = town or "Not specified"
+    fields = healthjobsuk_fields(tree)
 
     return {
         "source": "HealthJobsUK",
         "title": title,
-        "employer": employer,
-        "specialty": specialty,
-        "salary": salary,
-        "location": location,
+        "employer": fields.get("employer", "Not specified"),
+        "specialty": fields.get("specialty", "Not specified"),
+        "salary": fields.get("salary", "Not specified"),
+        "location": fields.get("location", "Not specified"),
     }
 
 
-def fetch_healthjobsuk_new_jobs(seen):
-    site = "https://www.healthjobsuk.com"
-
+async def fetch_healthjobsuk_new_jobs(client, seen, misses, http_cache):
     try:
-        r = requests.get(HEALTHJOBSUK_LIST_URL, timeout=20)
-        r.raise_for_status()
+        r = await conditional_get(client, HEALTHJOBSUK_LIST_URL, http_cache)
     except Exception as e:
         print("Failed to fetch HealthJobsUK list:", e)
         return []
+    if r is None:
+        print("HealthJobsUK list unchanged since last run.")
+        touch_ids(seen["healthjobsuk"], http_cache[HEALTHJOBSUK_LIST_URL].get("ids", []))
+        return []
 
-    soup = BeautifulSoup(r.text, "html.parser")
-    new_jobs = []
+    page = page_links(r)
+    if page is None:
+        return []
+
+    candidates = {}  # job_id -> (url, card details); the same job is often linked several times per page
+    links = {}  # job_id -> (url, <a>) for the links that match KEYWORDS
 
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        if not href.startswith("/job/UK/"):
+    for href, a in page:
+        if not href.startswith(HEALTHJOBSUK_JOB_PREFIX):
             continue
 
-        text = a.get_text(" ", strip=True).lower()
-        if not any(k in text for k in KEYWORDS):
+        text = link_text(a).lower()
+        if not KEYWORD_RE.search(text):
             continue
 
-        m = re.search(r"-v(\d+)", href)
+        m = HJ_ID_RE.search(href)
         job_id = m.group(1) if m else href
 
-        if job_id in seen["healthjobsuk"]:
-            continue
+        links.setdefault(job_id, (HEALTHJOBSUK_SITE + href, a))
 
-        full_url = site + href
-        details = parse_healthjobsuk_job_details(full_url)
-        if not details:
-            continue
-
-        seen["healthjobsuk"].append(job_id)
-        new_jobs.append((full_url, details))
+    missed = add_candidates(
+        candidates, links, seen["healthjobsuk"], misses["healthjobsuk"], "HealthJobsUK", healthjobsuk_fields
+    )
 
+    new_jobs, failed = await collect_new_jobs(
+        client, candidates, parse_healthjobsuk_job_details, misses["healthjobsuk"]
+    )
+    remember_pages(http_cache, [(HEALTHJOBSUK_LIST_URL, r, set(links), missed)], failed)
     return new_jobs
 
 
 # ========= MAIN =========
-def main():
+async def main():
     seen = load_seen()
-
-    nhs_jobs = fetch_nhs_new_jobs(seen)
-    hj_jobs = fetch_healthjobsuk_new_jobs(seen)
-
-    all_new = nhs_jobs + hj_jobs
-
-    if not all_new:
-        print("No new jobs this run.")
-    else:
-        for url, data in all_new:
-            title = (data.get("title") or "").strip()
-            if not title:
-                title = "New junior doctor role"
-            data["title"] = title
-
-            msg = format_message(url, data)
-            print("Sending job:", title)
-            send_telegram(msg)
+    misses = load_misses()
+    http_cache = load_http_cache()
+
+    async with make_client() as client:
+        nhs_jobs, hj_jobs = await asyncio.gather(
+            fetch_nhs_new_jobs(client, seen, misses, http_cache),
+            fetch_healthjobsuk_new_jobs(client, seen, misses, http_cache),
+        )
+
+        all_new = [("nhs", *job) for job in nhs_jobs] + [("healthjobsuk", *job) for job in hj_jobs]
+
+        if not all_new:
+            print("No new jobs this run.")
+        else:
+            entries = []
+            for source, job_id, url, data in all_new:
+                title = (data.get("title") or "").strip()
+                if not title:
+                    title = "New junior doctor role"
+                data["title"] = title
+
+                entries.append((format_message(url, data), (source, job_id, url)))
+                print("Sending job:", title)
+
+            for text, jobs in batch_messages(entries):
+                if await send_telegram(client, text):
+                    for source, job_id, _ in jobs:
+                        seen[source].add(job_id)
+                    continue
+                # Leave the batch's jobs unseen, and make the next run re-read the listing pages
+                # they came from in full rather than get a 304, so they are found and alerted again
+                print("Alert not delivered, will retry next run:", ", ".join(url for _, _, url in jobs))
+                for source in LISTING_URLS:
+                    forget_pages(http_cache, source, {job_id for src, job_id, _ in jobs if src == source})
 
     save_seen(seen)
+    save_misses(misses)
+    save_http_cache(http_cache)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())